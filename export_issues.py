@@ -8,19 +8,22 @@ https://gist.github.com/reberhardt7/bf197865297a95b5ac3d
 I modified it to fit my needs and released it unter the MIT License (with
 permission).
 
-This script uses Github's API V3 with a Token to export issues from
-a repository. The script saves a json file with all of the information from the
-API for issues, comments, and events (on the issues), downloads all of the
-images attached to issues, and generates a markdown file that can be rendered
-into a basic HTML page crudely mimicking Github's issue page.
+This script uses Github's API V3 (or optionally the GraphQL API V4) with a
+Token to export issues from a repository. The script saves a json file with all
+of the information from the API for issues, comments, and events (on the
+issues), downloads all of the images attached to issues, and generates a
+markdown file that can be rendered into a basic HTML page crudely mimicking
+Github's issue page.
 
 In the end, you'll be left with a folder containing a raw .json file (which you
 can use to extract information for your needs, or to import it somewhere else),
-a .md (markdown) file, in addition to any image files referenced in issues.
+a .md (markdown) file, in addition to any image files referenced in issues. The
+.json file is compressed with zstd (.json.zst), unless the script is run with
+--no-compress.
 
 To use the script, set the TOKEN and REPO variables below. You
-will need the requests library, easily installed via pip or setuptools ("pip
-install requests" or "easy_install requests").
+will need the requests, aiohttp, orjson and zstandard libraries, easily
+installed via pip ("pip install requests aiohttp orjson zstandard").
 
 The script is also somewhat modular, and functions can be imported by other
 scripts.
@@ -31,123 +34,702 @@ REPO = 'someusername/somerepo'  # username/repo
 ISSUE = None # Can be any issue number
 # The folder to download issue data to
 OUTPUT_FOLDER = '{}_issues'.format(REPO.replace('/', '_'))
+# The folder to cache API responses in, so that re-runs only download what
+# has changed
+CACHE_FOLDER = '.cache'
+# Download the issues with Github's GraphQL API instead of the REST API. This
+# needs far fewer requests, but the resulting JSON only contains the fields
+# that are needed for the Markdown output
+USE_GRAPHQL = False
+# Download who reacted how on each comment into 'reactions_detailed'. This is
+# one extra request per comment with reactions, and the Markdown output only
+# needs the summary that is part of the comment anyway
+FETCH_REACTION_DETAILS = False
 
+import argparse
+import asyncio
+import hashlib
+import heapq
 import os
 import re
 import requests
+import shutil
+import time
 import json
 import base64
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from operator import itemgetter
 
-def load_all_resource(url, token):
+import aiohttp
+import orjson
+import zstandard as zstd
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Maximum number of issues whose resources are downloaded at the same time,
+# and maximum number of simultaneous connections to the Github API. Keep this
+# low, Github's abuse detection doesn't like too many concurrent requests.
+CONCURRENCY = 10
+# How often a request that hit a rate limit or failed temporarily is retried
+MAX_RETRIES = 3
+
+# The rate limit state as reported by the most recent API response, per
+# rate limit resource (`core` for REST, `graphql` for GraphQL). The values are
+# the remaining requests and the time of the reset.
+_rate_limits = {}
+
+# Matches the URLs and their relation in a `Link` header
+_LINK_RE = re.compile(r'<([^>]+)>;\s*rel="([^"]+)"')
+# Matches the images that are embedded in issues, either as Markdown image or
+# as HTML tag, or at the start of a line. The path ends at whitespace, as
+# bodies may use CRLF line endings or continue the line with text.
+_IMG_RE = re.compile(
+    r'(?:^|[\("])https://(cloud|user-images)\.githubusercontent\.com/([^\s)"]+)',
+    re.MULTILINE)
+
+class ConditionalCache:
+    """
+    Stores the ETag and the body of API responses on disk. Resources that were
+    downloaded before are requested conditionally, if they didn't change,
+    Github replies with a `304 Not Modified` which doesn't count against the
+    rate limit.
+
+    It also remembers the version of every issue whose resources were
+    downloaded, so that they can be downloaded unconditionally once the issue
+    changed. A list that grew by another page may otherwise still get a
+    `304 Not Modified` for its previously last page.
+    """
+    def __init__(self, folder):
+        self.folder = folder
+        self.index_path = os.path.join(folder, 'etags.json')
+        self.versions_path = os.path.join(folder, 'issues.json')
+        self.entries = self._load_json(self.index_path)
+        self.versions = self._load_json(self.versions_path)
+
+    @staticmethod
+    def _load_json(path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def etag(self, url):
+        """
+        Returns the ETag of the cached response for a URL, if there is one.
+        """
+        entry = self.entries.get(url)
+        return entry['etag'] if entry else None
+
+    def load(self, url):
+        """
+        Returns the cached body and `Link` header of the response for a URL.
+        """
+        entry = self.entries[url]
+        with open(entry['path'], encoding='utf-8') as f:
+            return json.load(f), entry['link']
+
+    def store(self, url, etag, data, link):
+        """
+        Caches the body and `Link` header of a response. Responses without an
+        ETag are not cached.
+        """
+        if etag is None:
+            return
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder)
+        path = os.path.join(
+            self.folder,
+            hashlib.sha1(url.encode('utf-8')).hexdigest() + '.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        self.entries[url] = {'etag': etag, 'path': path, 'link': link}
+
+    def is_current(self, key, version):
+        """
+        Returns whether the resources of an issue were downloaded when the
+        issue had the given version.
+        """
+        return self.versions.get(key) == version
+
+    def set_version(self, key, version):
+        """
+        Remembers the version of an issue whose resources were downloaded.
+        """
+        self.versions[key] = version
+
+    def flush(self):
+        """
+        Writes the index of the cached responses and the issue versions to
+        disk.
+        """
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder)
+        with open(self.index_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f)
+        with open(self.versions_path, 'w', encoding='utf-8') as f:
+            json.dump(self.versions, f)
+
+def _issue_version(issue):
+    """
+    Returns what changes whenever the resources of an issue change, its update
+    time and its number of comments.
+    """
+    comments = issue['comments']
+    if not isinstance(comments, int):
+        comments = len(comments)
+    return [issue.get('updated_at'), comments]
+
+def _next_link(link):
+    """
+    Returns the URL of the next page from a `Link` header, or `None` if it's
+    the last page.
+    """
+    for url, rel in _LINK_RE.findall(link):
+        if rel == 'next':
+            return url
+    return None
+
+async def _request(session, method, url, **kwargs):
+    """
+    Sends a request to the Github API and returns the response, with its body
+    already read. If the rate limit is used up, it waits until it is reset.
+    Requests that hit a rate limit or that failed temporarily are retried.
+    """
+    # REST and GraphQL requests have separate rate limits
+    resource = 'graphql' if url.endswith('/graphql') else 'core'
+    for attempt in range(MAX_RETRIES + 1):
+        remaining, reset = _rate_limits.get(resource, (None, 0))
+        if remaining is not None and remaining <= 1:
+            await asyncio.sleep(max(0, reset - time.time()))
+        async with session.request(method, url, **kwargs) as r:
+            await r.read()
+        if 'X-RateLimit-Remaining' in r.headers:
+            resource = r.headers.get('X-RateLimit-Resource', resource)
+            reset = int(r.headers['X-RateLimit-Reset'])
+            _rate_limits[resource] = (
+                int(r.headers['X-RateLimit-Remaining']), reset)
+
+        if attempt == MAX_RETRIES:
+            break
+        if r.status in (403, 429) and r.headers.get('X-RateLimit-Remaining') == '0':
+            # The primary rate limit is used up, the next try waits for the
+            # reset
+            print('Rate limit exceeded, waiting until {}'.format(
+                time.ctime(reset)))
+            continue
+        if (r.status == 403 and 'rate limit' in (await r.text()).lower()) \
+                or r.status in (429, 503):
+            # Secondary rate limit or a temporary error. Github asks to wait
+            # at least a minute for the secondary rate limit if there's no
+            # `Retry-After` header.
+            if 'Retry-After' in r.headers:
+                delay = int(r.headers['Retry-After'])
+            else:
+                delay = (60 if r.status == 403 else 1) * 2 ** attempt
+            print('Github returned status code {} for {}, retrying in {}s'.format(
+                r.status, url, delay))
+            await asyncio.sleep(delay)
+            continue
+        break
+    return r
+
+async def load_all_resource(session, url, cache=None, conditional=True):
     """
     Downloads JSON from an API URL. Github paginates when many items are
     present; if a requested URL has multiple pages, this function will request
     all the pages and concatenate the results.
+
+    If a `ConditionalCache` is given, every page is requested conditionally
+    and served from the cache if it didn't change. If `conditional` is false,
+    the pages are downloaded unconditionally, but still cached.
     """
-    print(url)
-    headers = {
-        'Accept': 'application/vnd.github.squirrel-girl-preview+json',
-        'Authorization': 'token ' + token,
-    }
-    r = requests.get(url, headers=headers)
-    if not r.ok:
-        raise Exception('Github returned status code {} ({}) when loading {}. Check that '
-                        'your username, password, and repo name are correct.'.format(r.status_code, r.reason, url))
-    data = r.json()
-    # Load data from the next pages, if any
-    if 'link' in r.headers:
-        pages = {rel: url for url, rel in re.findall(r'<(.*?)>;\s+rel=\"(.*?)\"', r.headers['link'])}
-        print(pages)
-        if 'next' in pages:
-            data.extend(load_all_resource(pages['next'], token))
+    # Request as many items per page as possible, the URLs of the following
+    # pages keep that parameter
+    if 'per_page=' not in url:
+        sep = '&' if '?' in url else '?'
+        url = url + sep + 'per_page=100'
+    data = None
+    while url is not None:
+        print(url)
+        headers = {}
+        etag = cache.etag(url) if cache is not None and conditional else None
+        if etag is not None:
+            headers['If-None-Match'] = etag
+        r = await _request(session, 'GET', url, headers=headers)
+        if r.status == 304:
+            page, link = cache.load(url)
+            # Prefer the current pagination over the cached one
+            link = r.headers.get('link', link)
+        elif r.status >= 400:
+            raise Exception('Github returned status code {} ({}) when loading {}. Check that '
+                            'your username, password, and repo name are correct.'.format(r.status, r.reason, url))
+        else:
+            page = await r.json()
+            link = r.headers.get('link', '')
+            if cache is not None:
+                cache.store(url, r.headers.get('etag'), page, link)
+        if data is None:
+            data = page
+        else:
+            data.extend(page)
+        # Load data from the next page, if any
+        url = _next_link(link)
     return data
 
-def get_json(token, repo, issue = None):
+async def fetch_issue_subresources(sem, session, repo, issue, cache=None):
     """
-    Downloads all of the JSON for all of the issues in a repository. Also
-    retrieves the comments and events for each issue, and saves those in the
-    'comments' and 'events' attributes in the dictionary for each issue.
+    Retrieves the reactions, comments and events of a single issue and stores
+    them in the dictionary of the issue. For pull requests, the reviews, the
+    review comments and the source files are retrieved as well. The detailed
+    reactions of comments are only retrieved if `FETCH_REACTION_DETAILS` is
+    set.
     """
-    if issue is not None:
-        data = [
-            load_all_resource(
-                f'https://api.github.com/repos/{repo}/issues/{issue}',
-                token=token)]
-    else:
-        data = load_all_resource(f'https://api.github.com/repos/{repo}/issues?state=all',
-                                 token=token)
-    # Load the comments and events on each issue
-    for issue in data:
+    async with sem:
         print('#{}'.format(issue['number']))
-        issue['reactions'] = load_all_resource(
-            f'https://api.github.com/repos/{repo}/issues/{issue["number"]}/reactions',
-            token=token)
-        issue['comments'] = load_all_resource(issue['comments_url'],
-                                              token=token)
-        for comment in issue['comments']:
-            if comment['reactions']['total_count'] > 0:
-                comment['reactions_detailed'] = load_all_resource(
-                    comment['reactions']['url'],
-                    token=token)
-        issue['events'] = load_all_resource(issue['events_url'], token=token)
+        base_url = f'https://api.github.com/repos/{repo}'
+        # Download everything again if the issue changed since the last run.
+        # The version needs to be determined before the comments are replaced.
+        key = f'{repo}#{issue["number"]}'
+        version = _issue_version(issue)
+        conditional = cache is not None and cache.is_current(key, version)
+        resources = {
+            'reactions': f'{base_url}/issues/{issue["number"]}/reactions',
+            'comments': issue['comments_url'],
+            'events': issue['events_url'],
+        }
         # If it is a pull request, also extract the source files and review
         # comments
         if 'pull_request' in issue:
-            issue['reviews'] = load_all_resource(
-                f'https://api.github.com/repos/{repo}/pulls/{issue["number"]}/reviews',
-                token=token)
-            # Review comments don't have a `created_at` value. Copy the
-            # `submitted_at` value, so that further processing is more uniform
-            for review in issue['reviews']:
-                review['created_at'] = review['submitted_at']
-            issue['review_comments'] = load_all_resource(
-                f'https://api.github.com/repos/{repo}/pulls/{issue["number"]}/comments',
-                token=token)
-            issue['files'] = load_all_resource(
-                f'https://api.github.com/repos/{repo}/pulls/{issue["number"]}/files',
-                token=token)
-            for file_ in issue['files']:
-                file_['contents']= load_all_resource(
-                    file_['contents_url'],
-                    token=token)
+            resources['reviews'] = f'{base_url}/pulls/{issue["number"]}/reviews'
+            resources['review_comments'] = f'{base_url}/pulls/{issue["number"]}/comments'
+            resources['files'] = f'{base_url}/pulls/{issue["number"]}/files'
+        results = await asyncio.gather(
+            *(load_all_resource(session, url, cache, conditional)
+              for url in resources.values()))
+        issue.update(zip(resources, results))
+
+        # Review comments don't have a `created_at` value. Copy the
+        # `submitted_at` value, so that further processing is more uniform
+        for review in issue.get('reviews', []):
+            review['created_at'] = review['submitted_at']
+
+        # Resources that depend on the ones that were just downloaded
+        targets = []
+        tasks = []
+        for comment in issue['comments']:
+            if FETCH_REACTION_DETAILS and comment['reactions']['total_count'] > 0:
+                targets.append((comment, 'reactions_detailed'))
+                tasks.append(load_all_resource(
+                    session, comment['reactions']['url'], cache, conditional))
+        for file_ in issue.get('files', []):
+            targets.append((file_, 'contents'))
+            tasks.append(load_all_resource(
+                session, file_['contents_url'], cache, conditional))
+        results = await asyncio.gather(*tasks)
+        for (item, attribute), result in zip(targets, results):
+            item[attribute] = result
+        if cache is not None:
+            cache.set_version(key, version)
+
+# The parts of an issue or pull request that are requested via the GraphQL
+# API. Nested connections are limited to 100 items, if there are more, the
+# issue is downloaded via the REST API instead.
+_GRAPHQL_ISSUE_FIELDS = """
+    number title body state createdAt updatedAt closedAt
+    author { login }
+    reactions(first: 100) {
+      pageInfo { hasNextPage }
+      nodes { content user { login } }
+    }
+    comments(first: 100) {
+      pageInfo { hasNextPage }
+      nodes {
+        databaseId body createdAt
+        author { login }
+        reactions { totalCount }
+      }
+    }
+    timelineItems(first: 100, itemTypes: [LABELED_EVENT, ASSIGNED_EVENT,
+        REFERENCED_EVENT, CLOSED_EVENT, REOPENED_EVENT]) {
+      pageInfo { hasNextPage }
+      nodes {
+        __typename
+        ... on LabeledEvent { createdAt actor { login } label { name } }
+        ... on AssignedEvent {
+          createdAt actor { login } assignee { ... on Actor { login } }
+        }
+        ... on ReferencedEvent { createdAt actor { login } commit { oid } }
+        ... on ClosedEvent { createdAt actor { login } }
+        ... on ReopenedEvent { createdAt actor { login } }
+      }
+    }
+"""
+
+_GRAPHQL_PULL_FIELDS = """
+    reviews(first: 100) {
+      pageInfo { hasNextPage }
+      nodes { body state submittedAt author { login } }
+    }
+    reviewThreads(first: 50) {
+      pageInfo { hasNextPage }
+      nodes {
+        path line
+        comments(first: 50) {
+          pageInfo { hasNextPage }
+          nodes { body createdAt author { login } }
+        }
+      }
+    }
+"""
+
+# Github limits the number of nodes a single query may return, pull requests
+# contain more nested nodes, hence fewer of them are requested per page
+_GRAPHQL_QUERY = """
+query($owner: String!, $name: String!, $cursor: String) {
+  repository(owner: $owner, name: $name) {
+    %s(first: %d, after: $cursor) {
+      pageInfo { endCursor hasNextPage }
+      nodes { %s }
+    }
+  }
+}
+"""
+_GRAPHQL_ISSUES_QUERY = _GRAPHQL_QUERY % (
+    'issues', 100, _GRAPHQL_ISSUE_FIELDS)
+_GRAPHQL_PULLS_QUERY = _GRAPHQL_QUERY % (
+    'pullRequests', 25, _GRAPHQL_ISSUE_FIELDS + _GRAPHQL_PULL_FIELDS)
+
+# Mapping of the GraphQL names to the REST names
+_GRAPHQL_REACTIONS = {
+    'THUMBS_UP': '+1',
+    'THUMBS_DOWN': '-1',
+    'LAUGH': 'laugh',
+    'HOORAY': 'hooray',
+    'CONFUSED': 'confused',
+    'HEART': 'heart',
+    'ROCKET': 'rocket',
+    'EYES': 'eyes',
+}
+_GRAPHQL_EVENTS = {
+    'LabeledEvent': 'labeled',
+    'AssignedEvent': 'assigned',
+    'ReferencedEvent': 'referenced',
+    'ClosedEvent': 'closed',
+    'ReopenedEvent': 'reopened',
+}
+
+async def fetch_graphql(session, query, variables):
+    """
+    Runs a query against Github's GraphQL API and returns its data.
+    """
+    print('graphql {}'.format(variables))
+    r = await _request(session, 'POST', 'https://api.github.com/graphql',
+                       json={'query': query, 'variables': variables})
+    if r.status >= 400:
+        raise Exception('Github returned status code {} ({}) when running a GraphQL query. Check that '
+                        'your username, password, and repo name are correct.'.format(r.status, r.reason))
+    result = await r.json()
+    if 'errors' in result:
+        raise Exception('Github returned errors for a GraphQL query: {}'.format(
+            '; '.join(error['message'] for error in result['errors'])))
+    return result['data']
+
+def _graphql_user(actor):
+    """
+    Converts a GraphQL actor into a REST user. Deleted users are `null`.
+    """
+    return {'login': actor['login'] if actor else 'ghost'}
+
+def _graphql_to_rest(repo, node):
+    """
+    Converts an issue or pull request returned by the GraphQL API into the
+    same structure the REST API based `get_json()` returns. Returns the issue
+    and whether it's complete, i.e. none of the nested connections had more
+    items than were requested.
+    """
+    base_url = f'https://api.github.com/repos/{repo}'
+    number = node['number']
+    connections = [node['reactions'], node['comments'], node['timelineItems']]
+    issue = {
+        'number': number,
+        'title': node['title'],
+        'body': node['body'],
+        # Merged pull requests are closed ones in the REST API
+        'state': 'open' if node['state'] == 'OPEN' else 'closed',
+        'created_at': node['createdAt'],
+        'updated_at': node['updatedAt'],
+        'closed_at': node['closedAt'],
+        'user': _graphql_user(node['author']),
+        'comments_url': f'{base_url}/issues/{number}/comments',
+        'events_url': f'{base_url}/issues/{number}/events',
+        'reactions': [
+            {
+                'content': _GRAPHQL_REACTIONS.get(reaction['content'],
+                                                  reaction['content']),
+                'user': _graphql_user(reaction['user']),
+            }
+            for reaction in node['reactions']['nodes']],
+        'comments': [
+            {
+                'id': comment['databaseId'],
+                'body': comment['body'],
+                'created_at': comment['createdAt'],
+                'user': _graphql_user(comment['author']),
+                'reactions': {
+                    'total_count': comment['reactions']['totalCount'],
+                    'url': f'{base_url}/issues/comments/{comment["databaseId"]}/reactions',
+                },
+            }
+            for comment in node['comments']['nodes']],
+        'events': [],
+    }
+    for item in node['timelineItems']['nodes']:
+        event = {
+            'event': _GRAPHQL_EVENTS[item['__typename']],
+            'created_at': item['createdAt'],
+            'actor': _graphql_user(item['actor']),
+        }
+        if item['__typename'] == 'LabeledEvent':
+            event['label'] = {'name': item['label']['name']}
+        elif item['__typename'] == 'AssignedEvent':
+            event['assignee'] = _graphql_user(item['assignee'])
+        elif item['__typename'] == 'ReferencedEvent':
+            event['commit_id'] = item['commit']['oid'] if item['commit'] else None
+        issue['events'].append(event)
+
+    if 'reviews' in node:
+        issue['pull_request'] = {'url': f'{base_url}/pulls/{number}'}
+        connections.extend([node['reviews'], node['reviewThreads']])
+        issue['reviews'] = [
+            {
+                'body': review['body'],
+                'state': review['state'],
+                'submitted_at': review['submittedAt'],
+                # Same as for the REST API, so that further processing is
+                # more uniform
+                'created_at': review['submittedAt'],
+                'user': _graphql_user(review['author']),
+            }
+            for review in node['reviews']['nodes']]
+        issue['review_comments'] = []
+        for thread in node['reviewThreads']['nodes']:
+            connections.append(thread['comments'])
+            for comment in thread['comments']['nodes']:
+                issue['review_comments'].append({
+                    'path': thread['path'],
+                    'line': thread['line'],
+                    'body': comment['body'],
+                    'created_at': comment['createdAt'],
+                    'user': _graphql_user(comment['author']),
+                })
+
+    complete = not any(conn['pageInfo']['hasNextPage'] for conn in connections)
+    return issue, complete
+
+async def fetch_pull_files(sem, session, repo, issue, cache=None):
+    """
+    Retrieves the source files of a pull request including their contents.
+    The contents aren't available via the GraphQL API.
+    """
+    async with sem:
+        # Download everything again if the pull request changed since the
+        # last run
+        key = f'{repo}#{issue["number"]}'
+        version = _issue_version(issue)
+        conditional = cache is not None and cache.is_current(key, version)
+        issue['files'] = await load_all_resource(
+            session,
+            f'https://api.github.com/repos/{repo}/pulls/{issue["number"]}/files',
+            cache, conditional)
+        contents = await asyncio.gather(
+            *(load_all_resource(session, file_['contents_url'], cache,
+                                conditional)
+              for file_ in issue['files']))
+        for file_, content in zip(issue['files'], contents):
+            file_['contents'] = content
+        if cache is not None:
+            cache.set_version(key, version)
+
+async def fetch_reaction_details(sem, session, issue, cache=None):
+    """
+    Retrieves who reacted how on each comment of an issue that has reactions,
+    and stores it in the 'reactions_detailed' attribute of the comment.
+    """
+    async with sem:
+        comments = [comment for comment in issue['comments']
+                    if comment['reactions']['total_count'] > 0]
+        results = await asyncio.gather(
+            *(load_all_resource(session, comment['reactions']['url'], cache)
+              for comment in comments))
+        for comment, result in zip(comments, results):
+            comment['reactions_detailed'] = result
+
+async def load_all_graphql(sem, session, repo, cache=None):
+    """
+    Downloads all issues and pull requests of a repository via the GraphQL
+    API. The result has the same structure as the one of the REST API based
+    code path, so that it can be processed the same way.
+    """
+    owner, name = repo.split('/', 1)
+    data = []
+    tasks = []
+    for query, connection in ((_GRAPHQL_ISSUES_QUERY, 'issues'),
+                              (_GRAPHQL_PULLS_QUERY, 'pullRequests')):
+        variables = {'owner': owner, 'name': name, 'cursor': None}
+        while True:
+            result = await fetch_graphql(session, query, variables)
+            page = result['repository'][connection]
+            for node in page['nodes']:
+                issue, complete = _graphql_to_rest(repo, node)
+                data.append(issue)
+                if not complete:
+                    # Too much data for a single query, use the REST API
+                    tasks.append(fetch_issue_subresources(
+                        sem, session, repo, issue, cache))
+                else:
+                    if 'pull_request' in issue:
+                        tasks.append(fetch_pull_files(
+                            sem, session, repo, issue, cache))
+                    if FETCH_REACTION_DETAILS:
+                        tasks.append(fetch_reaction_details(
+                            sem, session, issue, cache))
+            if not page['pageInfo']['hasNextPage']:
+                break
+            variables['cursor'] = page['pageInfo']['endCursor']
+    await asyncio.gather(*tasks)
     return data
 
-def download_embedded_images(json_data, folder):
+async def get_json(token, repo, issue = None, cache=None, graphql=False):
     """
-    Downloads all of the images attached to issues for the repository.
+    Downloads all of the JSON for all of the issues in a repository. Also
+    retrieves the comments and events for each issue, and saves those in the
+    'comments' and 'events' attributes in the dictionary for each issue.
+
+    Pass a `ConditionalCache` to only download resources that changed since
+    the last run. If `graphql` is true, all issues of the repository are
+    downloaded via the GraphQL API, see `load_all_graphql()`.
     """
-    json_str = json.dumps(json_data)
-    for subdomain, path in re.findall(r'[\("]https:\/\/(cloud|user-images).githubusercontent.com\/(.*?)[\)"]', json_str):
-        img_url = f'https://{subdomain}.githubusercontent.com/{path}'
-        response = requests.get(img_url, stream=True)
+    headers = {
+        'Accept': 'application/vnd.github.squirrel-girl-preview+json',
+        'Authorization': 'token ' + token,
+    }
+    connector = aiohttp.TCPConnector(limit=CONCURRENCY)
+    async with aiohttp.ClientSession(headers=headers, connector=connector) as session:
+        sem = asyncio.Semaphore(CONCURRENCY)
+        if issue is None and graphql:
+            return await load_all_graphql(sem, session, repo, cache)
+        if issue is not None:
+            data = [
+                await load_all_resource(
+                    session,
+                    f'https://api.github.com/repos/{repo}/issues/{issue}',
+                    cache)]
+        else:
+            data = await load_all_resource(
+                session,
+                f'https://api.github.com/repos/{repo}/issues?state=all&per_page=100',
+                cache)
+        # Load the comments and events on each issue
+        await asyncio.gather(
+            *(fetch_issue_subresources(sem, session, repo, iss, cache)
+              for iss in data))
+    return data
+
+# The session used for downloading the embedded images. It's shared between
+# all threads, so that connections are kept alive and reused. Temporary
+# server errors are retried.
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=0.5,
+                      status_forcelist=[502, 503, 504])))
+
+def _image_filename(path):
+    """
+    Returns the name of the file an embedded image is stored in.
+    """
+    return base64.b64encode(path.encode('utf-8')).decode('ascii') + '.' + path.rsplit('.', 1)[-1]
+
+def _download_one(subdomain, path, folder):
+    """
+    Downloads a single embedded image into a folder.
+    """
+    img_url = f'https://{subdomain}.githubusercontent.com/{path}'
+    dest = os.path.join(folder, _image_filename(path))
+    with SESSION.get(img_url, stream=True) as response:
         if not response.ok:
             raise Exception('Got a bad response while download the embedded image from {}! {} {}'.format(img_url, response.status_code, response.reason))
-        filename = base64.b64encode(path.encode('utf-8')).decode('ascii') + '.' + path.rsplit('.', 1)[-1]
-        with open(os.path.join(folder, filename), 'wb') as f:
-            for block in response.iter_content(1024):
-                if not block:
-                    break
-                f.write(block)
+        # Write into a temporary file first, so that an interrupted download
+        # isn't mistaken for a complete one on the next run. Let urllib3 undo
+        # any content encoding and copy in large chunks.
+        response.raw.decode_content = True
+        with open(dest + '.part', 'wb') as f:
+            shutil.copyfileobj(response.raw, f, length=65536)
+    os.replace(dest + '.part', dest)
+
+def _find_images(data):
+    """
+    Yields the subdomain and path of every image embedded in any of the
+    strings within the given JSON data.
+    """
+    if isinstance(data, str):
+        yield from _IMG_RE.findall(data)
+    elif isinstance(data, dict):
+        for value in data.values():
+            yield from _find_images(value)
+    elif isinstance(data, list):
+        for value in data:
+            yield from _find_images(value)
+
+def download_embedded_images(json_data, folder, max_workers=8):
+    """
+    Downloads all of the images attached to issues for the repository, that
+    weren't downloaded yet. Up to `max_workers` images are downloaded at the
+    same time, if it is 1 or less, they are downloaded one after another.
+    """
+    # The same image is often referenced several times, download it only once.
+    # Images from previous runs are not downloaded again.
+    images = {}
+    for subdomain, path in _find_images(json_data):
+        filename = _image_filename(path)
+        if not os.path.exists(os.path.join(folder, filename)):
+            images[filename] = (subdomain, path)
+    matches = list(images.values())
+    if max_workers <= 1:
+        for subdomain, path in matches:
+            _download_one(subdomain, path, folder)
+        return
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Consume the results, so that exceptions are raised
+        list(executor.map(lambda match: _download_one(*match, folder), matches))
+
+@lru_cache(maxsize=256)
+def _underline(char, length):
+    """
+    Returns the underline of a header, headers are often of the same length.
+    """
+    return char * length
 
 def mkdown_h(text, level, link=None):
     """
     Generates the markdown syntax for a header of a certain level.
     """
+    anchor = f'<a name="{link}"></a>' if link else ''
     if level == 1:
-        return '\n' + ('<a name="{}"></a>'.format(link) if link else '') + text + '\n' \
-                + '='*len(text)
-    elif level == 2:
-        return '\n' + ('<a name="{}"></a>'.format(link) if link else '') + text + '\n' \
-                + '-'*len(text)
-    else:
-        return '\n' + '#'*level + ' ' + ('<a name="{}"></a>'.format(link) if link else '') + text
+        return f'\n{anchor}{text}\n{_underline("=", len(text))}'
+    if level == 2:
+        return f'\n{anchor}{text}\n{_underline("-", len(text))}'
+    return f'\n{"#" * level} {anchor}{text}'
 
 def mkdown_p(text):
     """
     Generates the markdown syntax for a paragraph.
     """
-    return '\n'.join([line.strip() for line in text.splitlines()]) + '\n'
+    return '\n'.join(line.strip() for line in text.splitlines()) + '\n'
 
 def mkdown_hr():
     """
@@ -159,50 +741,59 @@ def mkdown_blockquote(text):
     """
     Generates the markdown syntax for a blockquote.
     """
-    return '\n'.join([f'> {line.strip()}' for line in text.splitlines()])
+    return '\n'.join(f'> {line.strip()}' for line in text.splitlines())
 
-def build_markdown(repo, data):
+def build_markdown(repo, data, out):
     """
-    Generates the markdown for a repository's issue page. The resulting markdown
-    is a crude-but-functional mimicry of Github's issues.
+    Generates the markdown for a repository's issue page and writes it to the
+    file-like object `out`. The resulting markdown is a crude-but-functional
+    mimicry of Github's issues.
     """
-    lines = []
+    def writeline(text):
+        out.write(text)
+        out.write('\n')
+
+    issues_sorted = sorted(data, key=itemgetter('number'))
     if ISSUE is None:
-        lines.append(mkdown_h('{} Issues'.format(repo), 1))
-        for issue in sorted(data, key=lambda x: x['number']):
-            lines.append('* [{1}: {0}](#{1})'.format(issue['title'], issue['number']))
-            lines.append('')
-    for issue in sorted(data, key=lambda x: x['number']):
+        writeline(mkdown_h('{} Issues'.format(repo), 1))
+        for issue in issues_sorted:
+            writeline('* [{1}: {0}](#{1})'.format(issue['title'], issue['number']))
+            writeline('')
+    for issue in issues_sorted:
         link = None
         if ISSUE is None:
             link = issue['number']
-        lines.append(mkdown_h('#{}: {} ({})'.format(issue['number'], issue['title'], issue['state']), 2, link=link))
+        writeline(mkdown_h('#{}: {} ({})'.format(issue['number'], issue['title'], issue['state']), 2, link=link))
         closed_string = ', closed {}'.format(issue['closed_at']) if issue['closed_at'] else ''
-        lines.append(mkdown_p('Opened {} by {}'.format(issue['created_at'], issue['user']['login']) + closed_string))
-        lines.append(mkdown_p(issue['body']))
+        writeline(mkdown_p('Opened {} by {}'.format(issue['created_at'], issue['user']['login']) + closed_string))
+        writeline(mkdown_p(issue['body']))
 
         # If it is a Pull Request, then ouput all markdown files with review
         # comments
         if 'pull_request' in issue:
-            lines.append(mkdown_h('Files', 2))
+            writeline(mkdown_h('Files', 2))
+
+            # A dict where the key is the path and the value is a dict where
+            # the key is the line and the value is a list of comments sorted
+            # chronologically starting with the oldest
+            comments_by_path = defaultdict(lambda: defaultdict(list))
+            for comment in issue['review_comments']:
+                if comment['line'] is not None:
+                    comments_by_path[comment['path']][comment['line']].append(
+                        comment)
+            for comments in comments_by_path.values():
+                for line_comments in comments.values():
+                    line_comments.sort(key=itemgetter('created_at'))
+
             for file_ in issue['files']:
                 if file_['contents']['name'].endswith('.md'):
-                    lines.append(mkdown_p(f"`{file_['contents']['path']}`"))
+                    writeline(mkdown_p(f"`{file_['contents']['path']}`"))
                     contents = base64.b64decode(
                         file_['contents']['content']
                     ).decode('utf-8')
 
-                    # A dict where the key is the line and the value is a list
-                    # of comments sorted chronologically starting with the
-                    # oldest
-                    comments = defaultdict(list)
-                    for comment in issue['review_comments']:
-                        # Only look into comments of the current file
-                        if comment['path'] != file_['contents']['path']:
-                            continue
-
-                        if comment['line'] is not None:
-                            comments[comment['line']].append(comment)
+                    comments = comments_by_path.get(
+                        file_['contents']['path'], {})
 
                     # Contains the current code block opening line in case
                     # there was one
@@ -213,31 +804,37 @@ def build_markdown(repo, data):
                                 codeblock = line
                             else:
                                 codeblock = None
-                        lines.append(line)
+                        writeline(line)
                         if number in comments:
                             # Close current code block in order to output
                             # correctly formatted comments
                             if codeblock is not None:
-                                lines.append('```')
+                                writeline('```')
                             for comment in comments[number]:
-                                lines.append(mkdown_blockquote(mkdown_hr()))
-                                lines.append(mkdown_blockquote(
+                                writeline(mkdown_blockquote(mkdown_hr()))
+                                writeline(mkdown_blockquote(
                                     mkdown_h(
                                         '({}) {}:'.format(
                                             comment['created_at'],
                                             comment['user']['login']),
                                         4)))
-                                lines.append(mkdown_blockquote(
+                                writeline(mkdown_blockquote(
                                     comment['body']))
                             # Open the code block again
                             if codeblock is not None:
-                                lines.append(codeblock)
-                    lines.append(mkdown_hr())
+                                writeline(codeblock)
+                    writeline(mkdown_hr())
 
-        lines.append(mkdown_h('Comments', 2))
+        writeline(mkdown_h('Comments', 2))
 
         is_first_item = True
-        for item in sorted(issue['comments']+issue['events']+issue['reviews'], key=lambda x: x['created_at']):
+        # Github returns comments and events in chronological order already,
+        # hence merging them is enough. Reviews are in the order they were
+        # started, not submitted, so they need to be sorted first.
+        reviews = sorted(issue.get('reviews', []), key=itemgetter('created_at'))
+        timeline = heapq.merge(issue['comments'], issue['events'], reviews,
+                               key=itemgetter('created_at'))
+        for item in timeline:
             if 'body' in item and item['body'] == '':
                 continue
 
@@ -267,26 +864,39 @@ def build_markdown(repo, data):
                 if is_first_item:
                     is_first_item = False
                 else:
-                    lines.append(mkdown_hr())
-
-            lines.extend(items)
+                    writeline(mkdown_hr())
 
-    return '\n'.join(lines)
+            for line in items:
+                writeline(line)
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export Github issues.')
+    parser.add_argument('--no-compress', action='store_true',
+                        help='save the JSON uncompressed')
+    args = parser.parse_args()
     if not os.path.exists(OUTPUT_FOLDER):
         os.makedirs(OUTPUT_FOLDER)
     print('\033[32m' + 'Downloading issues...' + '\033[0m')
-    issues = get_json(TOKEN, REPO, ISSUE)
+    cache = ConditionalCache(CACHE_FOLDER)
+    try:
+        issues = asyncio.run(get_json(TOKEN, REPO, ISSUE, cache, USE_GRAPHQL))
+    finally:
+        cache.flush()
     print('\033[32m' + 'Downloading images attached to issues...' + '\033[0m')
     download_embedded_images(issues, OUTPUT_FOLDER)
     print('\033[32m' + 'Saving JSON...' + '\033[0m')
     filename = 'issues'
     if ISSUE is not None:
         filename = f'{ISSUE}'
-    with open(os.path.join(OUTPUT_FOLDER, f'{filename}.json'), 'w', encoding='utf-8') as f:
-        json.dump(issues, f, indent=4)
+    json_data = orjson.dumps(
+        issues, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    if args.no_compress:
+        with open(os.path.join(OUTPUT_FOLDER, f'{filename}.json'), 'wb') as f:
+            f.write(json_data)
+    else:
+        with open(os.path.join(OUTPUT_FOLDER, f'{filename}.json.zst'), 'wb') as raw, \
+                zstd.ZstdCompressor(level=3).stream_writer(raw) as f:
+            f.write(json_data)
     print('\033[32m' + 'Saving Markdown...' + '\033[0m')
-    markdown = build_markdown(REPO, issues)
     with open(os.path.join(OUTPUT_FOLDER, f'{filename}.md'), 'w', encoding='utf-8') as f:
-        f.write(markdown)
+        build_markdown(REPO, issues, f)